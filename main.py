@@ -39,6 +39,18 @@ flags.DEFINE_boolean(
     default=None,
     help="Update online playlists using local tags.",
 )
+flags.DEFINE_boolean(
+    name="refresh_cache",
+    default=False,
+    help="Ignore the saved copy of the online library, e.g. after deleting songs "
+    "from it outside of this script.",
+)
+flags.DEFINE_integer(
+    name="max_workers",
+    default=16,
+    lower_bound=1,
+    help="Maximum number of concurrent requests to YouTube Music.",
+)
 flags.DEFINE_boolean(
     name="confirm",
     default=True,
@@ -51,7 +63,7 @@ def main(argv):
     if not FLAGS.music_dir:
         user = getpass.getuser()
         FLAGS.music_dir = f"/home/{user}/Music"
-        logging.info("Local music directory set to: %s", FLAGS.music_dir)
+        logger.info("Local music directory set to: %s", FLAGS.music_dir)
         if FLAGS.confirm:
             accepted = input('Type "y" if this is correct directory: ')
             if accepted.lower() != "y":
@@ -60,7 +72,7 @@ def main(argv):
         # Assume headers are in same directory as this script.
         path, _ = os.path.split(os.path.realpath(__file__))
         FLAGS.headers = os.path.join(path, "headers_auth.json")
-        logging.info("Expecting request headers file at: %s", FLAGS.headers)
+        logger.info("Expecting request headers file at: %s", FLAGS.headers)
         if FLAGS.confirm:
             accepted = input('Type "y" if this is the correct file path: ')
             if accepted.lower() != "y" and FLAGS.confirm:
@@ -69,22 +81,25 @@ def main(argv):
     ytm_helper = YTMusicHelper(
         local_music_dir=FLAGS.music_dir,
         headers=FLAGS.headers,
+        max_workers=FLAGS.max_workers,
     )
 
     # Step 1: Library
     if FLAGS.sync_library:
-        ytm_helper.sync_local_library()
+        ytm_helper.sync_local_library(refresh=FLAGS.refresh_cache)
         # There is a delay between uploading songs and them being available to manage
         # for playlists. Probably some processing YT does for storage.
         # Hence, this sleep.
-        logging.info(
+        logger.info(
             "Pausing before updating playlists to ensure songs are available..."
         )
         time.sleep(60)
 
     # Step 2: Playlists
     if FLAGS.sync_playlists:
-        ytm_helper.update_cloud_playlists()
+        # No need to refresh twice: the sync already requested a fresh copy.
+        refresh = FLAGS.refresh_cache and not FLAGS.sync_library
+        ytm_helper.update_cloud_playlists(refresh=refresh)
 
 
 if __name__ == "__main__":
@@ -8,17 +8,121 @@ the .mp3 file extension. See README.md for more details.
 """
 
 import collections
+import fnmatch
+import functools
+import hashlib
+import json
 import logging
 import os
 import re
-import sys
 import time
-from glob import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
 from ytmusicapi import YTMusic
 
 logger = logging.getLogger(__name__)
 
+# Local files that are synced to the library: anything ending in "].mp3" with a "["
+# somewhere before it. For `glob`, the expression "[[]" means "match a single instance
+# of '['". We match names in a single directory listing rather than calling `glob`.
+_SONG_FILENAME_RE = re.compile(fnmatch.translate("*[[]*[]].mp3"))
+
+# The stricter naming convention needed to work out a song's playlists: a song name
+# (without any brackets) followed by the playlist tags in square brackets, immediately
+# before the .mp3 extension. The single group captures the tags. Always use with
+# `fullmatch`.
+_FILENAME_RE = re.compile(r"[^\[\]]+\[([A-Za-z]*)\]\.mp3")
+
+# Maximum number of songs sent in a single playlist edit request. Very large edits
+# are slow and more likely to be rejected by the server.
+_ADD_BATCH_SIZE = 100
+_REMOVE_BATCH_SIZE = 50
+
+# Mutating requests are occasionally rate limited. Retry these with an exponential
+# backoff (1s, 2s, 4s, ...) rather than aborting the whole sync.
+_RETRY_ATTEMPTS = 5
+_RETRY_INITIAL_DELAY = 1.0
+
+# Upper bound on the number of songs requested from the cloud library. This is only a
+# cap: `ytmusicapi` pages through the library with continuation requests and stops
+# when it runs out of songs, so a small library costs a few small requests.
+_CLOUD_LIBRARY_LIMIT = 500000
+
+# An uploaded song's IDs: `entity_id` is needed for deletion and `video_id` for
+# playlist management. A (named) tuple is much smaller than a dict per song.
+_CloudSong = collections.namedtuple("_CloudSong", ["entity_id", "video_id"])
+
+# State persisted between runs, e.g. the hash of each local file when last synced.
+# There is one state file per music directory and account, see `YTMusicHelper`.
+_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ytmusic_utils")
+_HASH_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
+def _chunks(seq, n):
+    """Yield successive slices of `seq` with (at most) `n` elements each."""
+    for i in range(0, len(seq), n):
+        yield seq[i : i + n]
+
+
+def _succeeded(result):
+    """Whether a mutating API call reported success. Most return the plain string
+    "STATUS_SUCCEEDED", but e.g. `add_playlist_items` returns a dict with a "status".
+    """
+    if isinstance(result, dict):
+        return "SUCCEEDED" in result.get("status", "")
+    return result == "STATUS_SUCCEEDED"
+
+
+def _is_transient(error):
+    """Whether an exception raised by an API call is worth retrying."""
+    if isinstance(error, requests.exceptions.RequestException):
+        return True
+    # `ytmusicapi` reports HTTP errors as a bare Exception with this message.
+    match = re.match(r"Server returned HTTP (\d+)", str(error))
+    return bool(match) and (match.group(1) == "429" or match.group(1)[0] == "5")
+
+
+def _hash_file(filepath):
+    """Hash the contents of a file, reading it in chunks to bound memory use."""
+    file_hash = hashlib.blake2b()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _file_record(filepath, known_record=None):
+    """Describe a file as [size, mtime_ns, hash]. If the size and modification time
+    match `known_record` (from a previous run) we trust its hash instead of reading the
+    whole file again.
+    """
+    stat = os.stat(filepath)
+    if known_record and known_record[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known_record
+    return [stat.st_size, stat.st_mtime_ns, _hash_file(filepath)]
+
+
+def _load_state(state_path):
+    """Load the state saved by a previous run, or an empty state on the first run."""
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict()
+
+
+def _save_state(state_path, state):
+    """Persist `state` for the next run."""
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    # Write to a temporary file first so an interrupted run can't corrupt the state.
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
 
 class YTMusicHelper:
     """Wrapper around API to help with some simple tasks."""
@@ -27,43 +131,247 @@ class YTMusicHelper:
         self,
         local_music_dir,
         headers,
+        max_workers=16,
     ):
-        self.music_dir = local_music_dir
-        self.ytm_client = YTMusic(headers)
+        # Always work with absolute paths rather than relying on the working directory.
+        self.music_dir = os.path.abspath(local_music_dir)
+        # Uploads/deletes are network bound so we issue them concurrently.
+        self.max_workers = max_workers
+        # Share one keep-alive connection pool between all the worker threads, sized
+        # so that no worker has to open (and TLS handshake) a fresh connection. This
+        # only covers calls made through the session, e.g. deletes and playlist edits.
+        # `upload_song` posts with the module-level `requests.post`, so every upload
+        # still opens its own connections.
+        # The adapter only retries failures to connect. Every API call is a POST, which
+        # urllib3 never retries on a status code; rate limits and server errors on
+        # mutating calls are handled by `_with_retry` instead.
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+            max_retries=3,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # `ytmusicapi` only sets a timeout on sessions it builds itself. Without one a
+        # stalled connection would hang its worker (and so the whole sync) forever.
+        session.request = functools.partial(session.request, timeout=30)
+        self.ytm_client = YTMusic(headers, requests_session=session)
+        # The saved file hashes only make sense for this directory, and the cached
+        # cloud library only for this account, so keep separate state for each pair.
+        if headers and os.path.isfile(headers):
+            headers = os.path.abspath(headers)
+        state_key = hashlib.sha256(f"{self.music_dir}\n{headers}".encode()).hexdigest()
+        self._state_path = os.path.join(_STATE_DIR, f"{state_key[:16]}.json")
+        # Cache of the local library, valid while the directory's mtime is unchanged.
+        self._local_songs = None
+        self._local_songs_mtime = None
+        # Cache of the cloud library. Reset to None whenever we change the library.
+        self._uploaded_songs = None
+
+    def _with_retry(self, fn, *args, **kwargs):
+        """Call a mutating API method until it reports success, backing off between
+        attempts. The API signals failure either by raising or by returning something
+        other than a success status (see `_succeeded`).
+
+        Only failures that may be transient are retried, i.e. a failure response, a
+        connection problem or a rate limit/server error. Anything else (e.g. a missing
+        file) fails straight away.
+
+        Args:
+            fn (callable): The `self.ytm_client` method to call.
+            *args, **kwargs: Passed through to `fn`.
+
+        Returns:
+            The successful result of `fn`.
+        """
+        delay = _RETRY_INITIAL_DELAY
+        for attempt in range(1, _RETRY_ATTEMPTS + 1):
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not _is_transient(e):
+                    raise RuntimeError(f"{fn.__name__} failed: {e}") from e
+                result = e
+            else:
+                if _succeeded(result):
+                    return result
+            logger.warning(
+                "Attempt %d/%d of %s failed: %s",
+                attempt,
+                _RETRY_ATTEMPTS,
+                fn.__name__,
+                result,
+            )
+            if attempt < _RETRY_ATTEMPTS:
+                time.sleep(delay)
+                delay *= 2
+        raise RuntimeError(
+            f"{fn.__name__} failed after {_RETRY_ATTEMPTS} attempts. "
+            f"Last response: {result}"
+        )
+
+    def _run_for_songs(self, fn, song_args, desc):
+        """Call a mutating API method once per song. The requests are independent so
+        we fire them off concurrently (each through `_with_retry`) and report progress
+        as they complete.
+
+        A failure is logged rather than aborting the remaining songs.
+
+        Args:
+            fn (callable): The `self.ytm_client` method to call.
+            song_args (dict): Song names mapped to the argument to call `fn` with.
+            desc (str): Label for the progress bar.
+
+        Returns:
+            set(str): The songs for which the call failed.
+        """
+        # Nothing to do, so don't print an empty progress bar.
+        if not song_args:
+            return set()
+
+        failed_songs = set()
+        # The workers share `self.ytm_client` without a lock. That is not quite free of
+        # shared state: every API call rewrites `self.ytm_client.headers`
+        # ["Authorization"] (which `upload_song` copies) with a fresh SAPISIDHASH. The
+        # race is harmless since every writer stores a valid, equivalent token and
+        # replacing a value for an existing key doesn't resize the dict.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._with_retry, fn, arg): song
+                for song, arg in song_args.items()
+            }
+            progress = tqdm(as_completed(futures), total=len(futures), desc=desc)
+            try:
+                for future in progress:
+                    song = futures[future]
+                    progress.set_postfix_str(song)
+                    try:
+                        future.result()
+                    except RuntimeError as e:
+                        logger.error("%s %s failed: %s", desc, song, e)
+                        failed_songs.add(song)
+            except BaseException:
+                # E.g. Ctrl-C. Leaving the `with` block waits for every queued song,
+                # so drop those that haven't started before giving up.
+                for future in futures:
+                    future.cancel()
+                raise
+        return failed_songs
 
     def _get_local_songs(self):
         """Searches the specified `local_music_dir` for .mp3 files with the naming
         convention described previously, i.e. square brackets capturing playlist tags.
 
-        We only want to bother with this step once. Hence, the try/except AttributeError
-        structure. That directory won't change during execution so this is a safe (i.e.
-        we do not need to worry that our information is out of date.)
+        The playlists are worked out in the same pass, e.g. "song_name [as].mp3" would
+        need to be added to playlists titled "a" and "s". A song whose name doesn't
+        strictly follow the convention (e.g. "song (Live) [Remix] [a].mp3") is still
+        synced, but isn't added to any playlist.
+
+        We only want to bother with this step once, so the result is cached. Adding,
+        removing or renaming a file updates the directory's mtime, so we rescan if that
+        has changed since (see also `invalidate_local_cache`).
 
         Returns:
-            list(str): Files are returned as "song_name [playlist_info].mp3", not the
-                full path.
+            tuple(list(str), dict): Files are returned as
+                "song_name [playlist_info].mp3", not the full path. The dict has
+                playlist titles as keys and the list of songs to be added as values.
         """
-        try:
-            return self.local_songs
-        except AttributeError:
-            # Set working directory to location of music files.
-            os.chdir(self.music_dir)
+        mtime = os.stat(self.music_dir).st_mtime_ns
+        if self._local_songs is not None and mtime == self._local_songs_mtime:
+            return self._local_songs
 
-            # Find matches.
-            # For `glob`, the expression "[[]" means "match a single instance of '['"
-            self.local_songs = glob("*[[]*[]].mp3")
+        local_songs = []
+        playlists = collections.defaultdict(list)
+        # We also report any non matches. That is, any other file in the folder.
+        ignored_files = set()
+        # Songs that are synced but whose tags we can't make sense of.
+        untagged_songs = set()
+
+        # A single pass over the directory. We deliberately don't `os.chdir` here
+        # since the working directory is shared by every thread in the process.
+        with os.scandir(self.music_dir) as entries:
+            for entry in entries:
+                # Like `glob`, skip hidden files.
+                if (
+                    entry.name.startswith(".")
+                    or not _SONG_FILENAME_RE.match(entry.name)
+                    or not entry.is_file()
+                ):
+                    ignored_files.add(entry.name)
+                    continue
+                local_songs.append(entry.name)
+                match = _FILENAME_RE.fullmatch(entry.name)
+                if match is None:
+                    untagged_songs.add(entry.name)
+                    continue
+                # The captured group is the string between the brackets.
+                for tag in match.group(1):
+                    playlists[tag].append(entry.name)
+
+        # Only build the (potentially huge) listing if it will actually be logged.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Ignored %d files: %s", len(ignored_files), ignored_files)
+        else:
+            logger.info("Ignored %d files.", len(ignored_files))
+        if untagged_songs:
+            logger.warning(
+                "%d songs don't follow the naming convention, so won't be added to "
+                "any playlist: %s",
+                len(untagged_songs),
+                untagged_songs,
+            )
 
-            # We also report any non matches. That is, any other file in the folder.
-            ignored_files = set(glob("*")) - set(self.local_songs)
-            logging.info("Ignored the following files:")
-            logging.info(ignored_files)
+        self._local_songs = (local_songs, playlists)
+        self._local_songs_mtime = mtime
+        return self._local_songs
 
-            return self.local_songs
+    def invalidate_local_cache(self):
+        """Force the next call to `_get_local_songs` to rescan the music directory."""
+        self._local_songs = None
+        self._local_songs_mtime = None
+
+    def _fetch_cloud_songs(self):
+        """Request information about songs that already have been uploaded to the
+        library. Prefer `_get_cloud_songs` which caches the result.
+
+        Returns:
+            dict: Song titles (in uploaded library) mapped to `_CloudSong` IDs.
+        """
+        logger.info("Requesting songs in cloud library.")
+        # No `order`: the songs go straight into a dict so any ordering is wasted.
+        uploaded_song_items = self.ytm_client.get_library_upload_songs(
+            limit=_CLOUD_LIBRARY_LIMIT,
+        )
+        logger.info("Found %d songs in cloud library.", len(uploaded_song_items))
+
+        # Retain the song title and various IDs.
+        return {
+            song_item["title"]: _CloudSong(song_item["entityId"], song_item["videoId"])
+            for song_item in uploaded_song_items
+        }
+
+    def _cloud_library_signature(self):
+        """A cheap fingerprint of the cloud library: the entity ID of the most recently
+        uploaded song. It changes whenever a song is uploaded, but NOT when a song is
+        deleted by some other client.
+
+        Returns:
+            str: The entity ID, or None if the library is empty.
+        """
+        latest_song_items = self.ytm_client.get_library_upload_songs(
+            limit=1,
+            order="recently_added",
+        )
+        return latest_song_items[0]["entityId"] if latest_song_items else None
 
     def _get_cloud_songs(self, force_update=False):
         """Get information about songs that already have been uploaded to the library.
-        We use the try/except block to avoid repeatedly running this operation if we
-        have already queried once.
+        The result is cached, so we only query again if `force_update` is set or we
+        have since modified the library (see `sync_local_library`).
+
+        The result is also saved between runs along with `_cloud_library_signature`.
+        If the signature still matches we skip the (slow) full request.
 
         The IDs we get from this query will help for a few reasons:
         1) We can avoid re-uploading everything which would be much slower.
@@ -72,36 +380,34 @@ class YTMusicHelper:
         fixing a typo, (3) we simply do not want it anymore, etc.
         3) We need the ID information when editing playlists.
 
+        Args:
+            force_update (bool): Ignore any cached result and query again.
+
         Returns:
-            dict: Song titles (in uploaded library) mapped to IDs.
+            dict: Song titles (in uploaded library) mapped to `_CloudSong` IDs.
         """
+        if self._uploaded_songs is not None and not force_update:
+            return self._uploaded_songs
+
+        signature = self._cloud_library_signature()
+        state = _load_state(self._state_path)
+        cached = state.get("cloud_songs")
+        if not force_update and cached and cached["signature"] == signature:
+            logger.info("Using cached copy of cloud library.")
+            self._uploaded_songs = {
+                title: _CloudSong(*ids) for title, ids in cached["songs"].items()
+            }
+            return self._uploaded_songs
 
-        def get_songs():
-            uploaded_songs = dict()
-            logging.info("Requesting songs in cloud library.")
-            uploaded_song_items = self.ytm_client.get_library_upload_songs(
-                limit=500000,
-                order="a_to_z",
-            )
-
-            # Retain the song title and various IDs.
-            for song_item in uploaded_song_items:
-                uploaded_songs[song_item["title"]] = {
-                    "entityId": song_item["entityId"],  # Needed for deletion.
-                    "videoId": song_item["videoId"],  # Needed for playlist management.
-                }
-
-            return uploaded_songs
-
-        try:
-            if force_update:
-                self.uploaded_songs = get_songs()
-            return self.uploaded_songs
-        except AttributeError:
-            self.uploaded_songs = get_songs()
-            return self.uploaded_songs
+        self._uploaded_songs = self._fetch_cloud_songs()
+        state["cloud_songs"] = {
+            "signature": signature,
+            "songs": self._uploaded_songs,
+        }
+        _save_state(self._state_path, state)
+        return self._uploaded_songs
 
-    def sync_local_library(self):
+    def sync_local_library(self, refresh=False):
         """This is a unidirectional sync: local --> cloud.
 
         After running this the YouTube library will contain exactly (therefore ONLY) the
@@ -111,95 +417,129 @@ class YTMusicHelper:
         (1) Upload any missing songs.
         (2) Delete any previously uploaded songs that do not match locally.
 
-        N.B. if you change the actual file locally but keep the name the same (e.g.
-        better quality, different version, etc.) the file will not change. TODO: Check
-        file hash instead to avoid this problem.
+        If you change the actual file locally but keep the name the same (e.g. better
+        quality, different version, etc.) we notice because the file hash differs from
+        the one recorded on the previous sync. The old upload is deleted and the new
+        file uploaded. Files without a recorded hash (e.g. on the first run) are assumed
+        to be unchanged.
+
+        Args:
+            refresh (bool): Ignore the copy of the cloud library saved by a previous
+            run. Needed if songs were deleted from the library some other way.
         """
-        # Get libraries in both locations.
-        local_song_files = self._get_local_songs()
-        cloud_songs = self._get_cloud_songs()
+        # Get libraries in both locations. They are independent (disk vs network) so
+        # we scan and hash the local files while waiting on the cloud request.
+        # `ytmusicapi` doesn't let us process the cloud listing page by page, so this
+        # is the only local work we can hide behind it.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            cloud_future = executor.submit(self._get_cloud_songs, force_update=refresh)
+            local_song_files, _ = self._get_local_songs()
+            known_files = _load_state(self._state_path).get("files", dict())
+            local_files = self._hash_local_songs(local_song_files, known_files)
+            cloud_songs = cloud_future.result()
 
         # Work out deltas.
-        missing_songs = set(local_song_files) - set(cloud_songs)
-        extra_songs = set(cloud_songs) - set(local_song_files)
+        # Only the local titles are copied into a set. The cloud library can be much
+        # bigger, so we only ever test membership against its dict. (Subtracting from
+        # `cloud_songs.keys()` would quietly copy every cloud title into a new set.)
+        local_songs = set(local_song_files)
+        missing_songs = local_songs.difference(cloud_songs)
+        extra_songs = {song for song in cloud_songs if song not in local_songs}
+        songs_in_both = local_songs - missing_songs
+
+        # Songs that are in both places may still have changed locally.
+        changed_songs = {
+            song
+            for song in songs_in_both
+            if song in known_files and known_files[song][2] != local_files[song][2]
+        }
+        # Replace the cloud copy of changed songs.
+        missing_songs |= changed_songs
+        extra_songs |= changed_songs
+
+        # The hashes of what we are about to delete, as recorded when uploaded. None if
+        # we never recorded it.
+        deleted_hashes = {
+            known_files[song][2] if song in known_files else None
+            for song in extra_songs
+        }
+
+        # Our cached view of the cloud library is about to go out of date. Forget it
+        # before changing anything, so an interrupted run can't leave a stale copy.
+        if extra_songs or missing_songs:
+            self._uploaded_songs = None
+            state = _load_state(self._state_path)
+            if state.pop("cloud_songs", None) is not None:
+                _save_state(self._state_path, state)
 
         # Delete "old" songs.
-        extra_songs_total = len(extra_songs)
-        for i, song in enumerate(extra_songs, 1):
-            song_id = cloud_songs[song]["entityId"]
-            sys.stdout.write(f"\rDeleting {song:<40} [{i:<4}/{extra_songs_total:<4}]")
-            delete_result = self.ytm_client.delete_upload_entity(song_id)
-            assert (
-                delete_result == "STATUS_SUCCEEDED"
-            ), f"Failed to delete {song}. Response from request: {delete_result}."
-            sys.stdout.flush()
-
-        if extra_songs_total > 0:
-            # TODO: Remove this when we check for whether the song is the same.
-            # We only have to do this now because YouTube does not like it when we delete
-            # and re-upload the same file.
-            logging.info("Pausing before uploading to prevent 409 Conflict...")
+        failed_songs = self._run_for_songs(
+            self.ytm_client.delete_upload_entity,
+            {song: cloud_songs[song].entity_id for song in extra_songs},
+            desc="Deleting",
+        )
+        # Don't upload a second copy of a changed song if the old one is still there.
+        missing_songs -= failed_songs
+
+        # YouTube does not like it when we delete and re-upload the same file, e.g.
+        # because only its name (i.e. its playlist tags) changed. There is no way to
+        # rename an upload, so we pause to prevent a 409 Conflict, but only when we
+        # know (or can't rule out) that the same bytes are being uploaded again.
+        uploaded_hashes = {local_files[song][2] for song in missing_songs}
+        if missing_songs and (
+            None in deleted_hashes or not deleted_hashes.isdisjoint(uploaded_hashes)
+        ):
+            logger.info("Pausing before uploading to prevent 409 Conflict...")
             time.sleep(15)
 
         # Upload new songs.
-        missing_songs_total = len(missing_songs)
-        for i, song in enumerate(missing_songs, 1):
-            missing_song_filepath = os.path.join(self.music_dir, song)
-            # Syntax f'{:<n}' to print at least n character, left aligned.
-            # Prevents leftover chars once the next output is printed.
-            sys.stdout.write(
-                f"\rUploading {song:<40} [{i:<4}/{missing_songs_total:<4}]"
+        failed_songs |= self._run_for_songs(
+            self.ytm_client.upload_song,
+            {song: os.path.join(self.music_dir, song) for song in missing_songs},
+            desc="Uploading",
+        )
+
+        state = _load_state(self._state_path)
+        # The cloud now matches these files, apart from any songs that failed. For
+        # those keep what we knew before so they are picked up again next time.
+        files = {s: r for s, r in local_files.items() if s not in failed_songs}
+        files.update({s: known_files[s] for s in failed_songs if s in known_files})
+        state["files"] = files
+        _save_state(self._state_path, state)
+
+        if failed_songs:
+            raise RuntimeError(
+                f"Failed to sync {len(failed_songs)} songs. See the log for details."
             )
-            upload_result = self.ytm_client.upload_song(missing_song_filepath)
-            assert (
-                upload_result == "STATUS_SUCCEEDED"
-            ), f"Failed to upload {song}. Response from request: {upload_result}"
-            sys.stdout.flush()
 
-    def _parse_song_playlist(self, filename):
-        """Given a song filename, work out the playlists it belongs to based on the
-        tagging convention. e.g.
-        "song_name [as].mp3" would need to be added to playlists titled "a" and "s".
+    def _hash_local_songs(self, song_files, known_files):
+        """Hash the contents of local songs. Files whose size and modification time
+        are unchanged since the previous run keep their recorded hash. Reading the
+        rest is I/O bound so we hash them concurrently.
 
         Args:
-            filename (str): The name of the file as "song_name [playlist_info].mp3", not
-            the full path.
+            song_files (list(str)): File names within `self.music_dir`.
+            known_files (dict): File names mapped to [size, mtime_ns, hash] from a
+            previous run.
 
         Returns:
-            list(str): The playlist titles the song should be added to.
+            dict: File names mapped to [size, mtime_ns, hash].
         """
-        # Construct regex to validate the string.
-        # Note this is more involved than the earlier `glob` check.
-        # TODO: Explain the regex.
-        # TODO: Do this proper check earlier.
-        regex = r"^[^\[\]]+(\[[A-Za-z]*\])\.mp3$"
-        regex = re.compile(regex)
-        regex_error = f'Song "{filename}" does not follow expected naming convention.'
-        assert regex.match(filename), regex_error
-
-        # Get the string between the brackets and convert to list
-        playlist_tags = list(filename[filename.find("[") + 1 : filename.find("]")])
-
-        return playlist_tags
+        filepaths = [os.path.join(self.music_dir, song) for song in song_files]
+        known_records = [known_files.get(song) for song in song_files]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(
+                zip(song_files, executor.map(_file_record, filepaths, known_records))
+            )
 
     def _infer_local_playlists(self):
         """Get all the playlists for the local library.
 
         Returns:
             dict: Playlist titles as keys and where each value is a list of songs to be
-            added. The songs in the list are the full local file PATH.
+            added. The songs are file names, not the full path.
         """
-        local_song_filepaths = self._get_local_songs()
-
-        playlists = collections.defaultdict(list)
-
-        for song_filepath in local_song_filepaths:
-            _, song_filename = os.path.split(song_filepath)
-            # Work which playlists, if any, this song needs to belong to.
-            playlist_tags = self._parse_song_playlist(song_filename)
-            for tag in playlist_tags:
-                playlists[tag].append(song_filepath)
-
+        _, playlists = self._get_local_songs()
         return playlists
 
     def _match_playlists(self, local_playlists):
@@ -225,7 +565,7 @@ class YTMusicHelper:
         cloud_playlists = dict()
 
         # Step 1
-        logging.info("Requesting playlists in cloud library.")
+        logger.info("Requesting playlists in cloud library.")
         playlist_items = self.ytm_client.get_library_playlists()
 
         # Step 2
@@ -241,7 +581,7 @@ class YTMusicHelper:
             elif len(playlist_name) > 1:
                 pass
             else:
-                logging.info(
+                logger.info(
                     "Deleting playlist %s with id %s",
                     playlist_name,
                     playlist_id,
@@ -254,6 +594,8 @@ class YTMusicHelper:
                 assert "error" not in deletion_result, "Failed to delete playlist."
 
         # Anything still in `local_playlists` must not exist so we need to create.
+        # This is deliberately serial: YouTube limits how quickly playlists can be
+        # created (see `update_cloud_playlists`).
         for missing_local_playlist in local_playlists:
             creation_result = self.ytm_client.create_playlist(
                 title=missing_local_playlist,
@@ -278,23 +620,41 @@ class YTMusicHelper:
         Returns:
             dict: Contains YouTube library IDs required to manage playlist items.
         """
-        songs = dict()
-
-        playlist_info = self.ytm_client.get_playlist(
+        song_items = self.ytm_client.get_playlist(
             playlistId=playlist_id,
             # If you have more than 10000 songs in a playlist, it's a library mate.
             limit=10000,
-        )
-        song_items = playlist_info["tracks"]
-        for song_item in song_items:
-            songs[song_item["title"]] = {
+        )["tracks"]
+
+        # `remove_playlist_items` expects exactly these two keys for each item.
+        return {
+            song_item["title"]: {
                 "videoId": song_item["videoId"],
                 "setVideoId": song_item["setVideoId"],
             }
+            for song_item in song_items
+        }
 
-        return songs
+    def _prefetch_playlist_contents(self, playlist_ids):
+        """Get the songs in several cloud playlists at once. The requests are
+        independent so they are issued concurrently.
 
-    def _match_playlist_items(self, playlist_id, songs):
+        Args:
+            playlist_ids (iterable(str)): The entity IDs of the playlists.
+
+        Returns:
+            dict: Playlist IDs mapped to the output of `_get_cloud_playlist_songs`.
+        """
+        playlist_ids = list(playlist_ids)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(
+                zip(
+                    playlist_ids,
+                    executor.map(self._get_cloud_playlist_songs, playlist_ids),
+                )
+            )
+
+    def _match_playlist_items(self, playlist_id, songs, cloud_playlist=None):
         """Updates an existing cloud playlist to have all and only the songs provided
         with the argument.
 
@@ -306,47 +666,47 @@ class YTMusicHelper:
 
         Args:
             playlist_id (str): The entity ID of the playlists to be updated.
-            songs (list[str]): The song names. This should match the "title" key from
-            the YouTube API response.
+            songs (dict): The song names mapped to their video IDs. The names should
+            match the "title" key from the YouTube API response.
+            cloud_playlist (dict, optional): The current contents of the cloud
+            playlist, if already fetched. See `_prefetch_playlist_contents`.
         """
         # It would probably be easier to just straight up remove all the items and add
         # from scratch but whatever...
         # This will be a dictionary of dictionaries:
         # {"song_name": {"videoId": ..., "setVideoId": ...,}, ...}
-        cloud_playlist = self._get_cloud_playlist_songs(playlist_id)
+        if cloud_playlist is None:
+            cloud_playlist = self._get_cloud_playlist_songs(playlist_id)
 
         # Step 1
-        songs_to_remove = {  # Songs in the cloud playlist but not required.
-            song: ids for song, ids in cloud_playlist.items() if song not in songs
-        }
-        if len(songs_to_remove) > 0:
-            # Here we need both the videoId and setVideoId
-            # They just have to be keys in a dictionary for each item (where the item)
-            # is a list.
-            result = self.ytm_client.remove_playlist_items(
+        # Songs in the cloud playlist but not required.
+        songs_to_remove = cloud_playlist.keys() - songs.keys()
+        # Here we need both the videoId and setVideoId
+        # They just have to be keys in a dictionary for each item (where the item)
+        # is a list.
+        # Batches are sent one after another: playlists are already updated
+        # concurrently and we don't want to race edits to the same playlist.
+        videos_to_remove = [cloud_playlist[song] for song in songs_to_remove]
+        for videos in _chunks(videos_to_remove, _REMOVE_BATCH_SIZE):
+            self._with_retry(
+                self.ytm_client.remove_playlist_items,
                 playlistId=playlist_id,
-                videos=[*songs_to_remove.values()],
+                videos=videos,
             )
 
-            assert (
-                result == "STATUS_SUCCEEDED"
-            ), f"Failed to remove items to playlist with ID: {playlist_id}"
-
         # Step 2
-        songs_to_add = {  # Songs required but not in the cloud playlist.
-            song: id for song, id in songs.items() if song not in cloud_playlist
-        }
-        if len(songs_to_add) >= 1:
-            # In this case we just need the video id
-            result = self.ytm_client.add_playlist_items(
+        # Songs required but not in the cloud playlist.
+        songs_to_add = songs.keys() - cloud_playlist.keys()
+        # In this case we just need the video id
+        video_ids_to_add = [songs[song] for song in songs_to_add]
+        for video_ids in _chunks(video_ids_to_add, _ADD_BATCH_SIZE):
+            self._with_retry(
+                self.ytm_client.add_playlist_items,
                 playlistId=playlist_id,
-                videoIds=[*songs_to_add.values()],
+                videoIds=video_ids,
             )
-            assert (
-                result == "STATUS_SUCCEEDED"
-            ), f"Failed to add items to playlist with ID: {playlist_id}"
 
-    def update_cloud_playlists(self):
+    def update_cloud_playlists(self, refresh=False):
         """The easiest option to code is to delete all playlists and then recreate from
         scratch (because the operation(s) are so cheap).
         However, you can easily hit the YouTube API limit for playlist creation if this
@@ -359,37 +719,67 @@ class YTMusicHelper:
         the end of file names.
         2: Create/delete cloud playlists to match local.
         3: Update playlists. That is, add/remove the items in the playlists.
+
+        Args:
+            refresh (bool): Ignore the copy of the cloud library saved by a previous
+            run (see `sync_local_library`).
         """
-        # Step 1
-        local_playlists = self._infer_local_playlists()  # Dict of {playlist: songs}
-        required_playlists = [*local_playlists]  # Get the keys (i.e. playlist names)
+        # The songs in the cloud library are only needed in step 3 and don't depend on
+        # steps 1 and 2, so request them in the background straight away.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            cloud_songs_future = executor.submit(
+                self._get_cloud_songs, force_update=refresh
+            )
 
-        # Step 2
-        cloud_playlists = self._match_playlists(required_playlists)
+            # Step 1
+            local_playlists = self._infer_local_playlists()  # Dict of {playlist: songs}
+            required_playlists = [*local_playlists]  # Keys, i.e. playlist names
+
+            # Step 2
+            cloud_playlists = self._match_playlists(required_playlists)
 
-        # Step 3
-        uploaded_songs = self._get_cloud_songs(force_update=True)
+            # Step 3
+            uploaded_songs = cloud_songs_future.result()
+
+        # Fetch the current contents of every playlist up-front, all at once.
+        cloud_playlist_contents = self._prefetch_playlist_contents(
+            cloud_playlists.values()
+        )
 
         # For each playlist we need to get the corresponding entity (playlist) IDs.
         # Once we have them we create the new playlists with the appropriate title.
-        playlists_to_update = len(local_playlists)
-        updated = 0
-
-        for local_playlist in local_playlists:
-            song_names = local_playlists[local_playlist]
-            songs = dict()
-            # For each song in each playlist we need to get the YouTube Music ID to be
-            # able to manage it.
-            for song in song_names:
-                song_id = uploaded_songs[song]["videoId"]
-                songs[song] = song_id
-            # Get target cloud playlist ID
-            playlist_id = cloud_playlists[local_playlist]
-
-            # Progress output.
-            updated += 1
-            sys.stdout.write(
-                f"\rUpdating playlist {local_playlist:<3} [{updated:<3}/{playlists_to_update:<3}]",
+        # Playlists are independent of each other so they are updated concurrently.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = dict()
+            for local_playlist in local_playlists:
+                song_names = local_playlists[local_playlist]
+                # For each song in each playlist we need to get the YouTube Music ID
+                # to be able to manage it.
+                songs = {song: uploaded_songs[song].video_id for song in song_names}
+                # Get target cloud playlist ID
+                playlist_id = cloud_playlists[local_playlist]
+
+                future = executor.submit(
+                    self._match_playlist_items,
+                    playlist_id,
+                    songs,
+                    cloud_playlist_contents[playlist_id],
+                )
+                futures[future] = local_playlist
+
+            progress = tqdm(
+                as_completed(futures),
+                total=len(futures),
+                desc="Updating playlists",
             )
-            sys.stdout.flush()
-            self._match_playlist_items(playlist_id, songs)
+            try:
+                for future in progress:
+                    progress.set_postfix_str(futures[future])
+                    # Re-raise anything that went wrong in the worker.
+                    future.result()
+            except BaseException:
+                # Don't wait for the playlists that haven't started (see
+                # `_run_for_songs`).
+                for future in futures:
+                    future.cancel()
+                raise